@@ -0,0 +1,183 @@
+"""Aggregated statistics of the stroke stream."""
+
+from threading import Lock
+from time import monotonic
+from typing import List, Optional, TypedDict
+
+from plover_engine_server.errors import (
+    ERROR_ANALYTICS_WINDOW,
+    ERROR_ANALYTICS_TOP_OUTLINES,
+    ERROR_ANALYTICS_INTERVAL
+)
+
+
+DEFAULT_WINDOW: int = 60
+DEFAULT_INTERVAL: float = 5
+DEFAULT_TOP_OUTLINES: int = 20
+
+
+class AnalyticsConfig(TypedDict, total=False):
+    """Configuration of the stroke analytics.
+
+    Attributes:
+        enabled: Whether the analytics are computed at all.
+        window: The length of the sliding window, in seconds.
+        interval: The number of seconds between two published summaries,
+            0 to only serve them on demand.
+        top_outlines: The number of most frequent outlines to report.
+    """
+
+    enabled: bool
+    window: int
+    interval: float
+    top_outlines: int
+
+
+class StrokeAnalytics:
+    """Sliding window statistics of the stroke stream, in fixed memory.
+
+    The window is a ring of one second buckets, so recording is O(1) and a
+    summary is O(window). Outline frequencies are counted over the whole
+    session with the space-saving algorithm, which keeps a bounded number
+    of counters and is exact for the outlines that are frequent enough.
+
+    Recorded from the engine thread and read from the server event loop.
+
+    Attributes:
+        interval: The number of seconds between two published summaries,
+            0 to only serve them on demand.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW,
+                 top_outlines: int = DEFAULT_TOP_OUTLINES,
+                 interval: float = DEFAULT_INTERVAL):
+        """Initialize the analytics.
+
+        Args:
+            window: The length of the sliding window, in seconds.
+            top_outlines: The number of most frequent outlines to report,
+                0 to not count outlines.
+            interval: The number of seconds between two published summaries,
+                0 to only serve them on demand.
+        """
+
+        self.interval = interval
+        self._lock = Lock()
+        self._window = max(1, int(window))
+        self._top_outlines = max(0, top_outlines)
+        self._outline_capacity = self._top_outlines * 4
+        # [second, strokes, characters, undos, misstrokes] for each second of the window
+        self._buckets = [[-1, 0, 0, 0, 0] for _ in range(self._window)]
+        self._outlines = {}
+        self._started = monotonic()
+        self._total_strokes = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[AnalyticsConfig]) -> Optional['StrokeAnalytics']:
+        """Creates the analytics from their configuration.
+
+        Args:
+            config: The analytics configuration.
+
+        Returns:
+            The analytics, or None if they are not enabled.
+
+        Raises:
+            ValueError: A setting is not a number in its valid range.
+        """
+
+        config = config or {}
+        if not config.get('enabled'):
+            return None
+
+        window = config.get('window', DEFAULT_WINDOW)
+        top_outlines = config.get('top_outlines', DEFAULT_TOP_OUTLINES)
+        interval = config.get('interval', DEFAULT_INTERVAL)
+        if not isinstance(window, int) or isinstance(window, bool) or window < 1:
+            raise ValueError(ERROR_ANALYTICS_WINDOW)
+        if not isinstance(top_outlines, int) or isinstance(top_outlines, bool) or top_outlines < 0:
+            raise ValueError(ERROR_ANALYTICS_TOP_OUTLINES)
+        if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval < 0:
+            raise ValueError(ERROR_ANALYTICS_INTERVAL)
+        return cls(window, top_outlines, interval)
+
+    def _bucket(self, now: float) -> list:
+        second = int(now)
+        bucket = self._buckets[second % self._window]
+        if bucket[0] != second:
+            bucket[:] = [second, 0, 0, 0, 0]
+        return bucket
+
+    def record_stroke(self, outline: str, undo: bool = False,
+                      untranslated: bool = False):
+        """Records a stroke.
+
+        Args:
+            outline: The RTF/CRE representation of the stroke.
+            undo: Whether the stroke undid the previous translation.
+            untranslated: Whether the stroke had no translation.
+        """
+
+        with self._lock:
+            bucket = self._bucket(monotonic())
+            bucket[1] += 1
+            if undo:
+                bucket[3] += 1
+            if untranslated:
+                bucket[4] += 1
+            self._total_strokes += 1
+            if self._outline_capacity:
+                self._count_outline(outline)
+
+    def _count_outline(self, outline: str):
+        outlines = self._outlines
+        if outline in outlines:
+            outlines[outline] += 1
+        elif len(outlines) < self._outline_capacity:
+            outlines[outline] = 1
+        else:
+            # space-saving: the new outline inherits the smallest counter
+            evicted = min(outlines, key=outlines.get)
+            outlines[outline] = outlines.pop(evicted) + 1
+
+    def record_output(self, characters: int):
+        """Records a change in the length of the output.
+
+        Args:
+            characters: The number of characters added, negative if
+                characters were removed.
+        """
+
+        with self._lock:
+            self._bucket(monotonic())[2] += characters
+
+    def summary(self) -> dict:
+        """Returns the statistics over the current window."""
+
+        with self._lock:
+            now = monotonic()
+            oldest = int(now) - self._window
+            strokes = characters = undos = misstrokes = 0
+            for second, *counts in self._buckets:
+                if second > oldest:
+                    strokes += counts[0]
+                    characters += counts[1]
+                    undos += counts[2]
+                    misstrokes += counts[3]
+            top: List[list] = sorted(self._outlines.items(),
+                                     key=lambda item: item[1],
+                                     reverse=True)[:self._top_outlines]
+            total_strokes = self._total_strokes
+
+        # do not underestimate the rates before a full window has elapsed
+        window = max(1.0, min(float(self._window), now - self._started))
+        return {
+            'window': window,
+            'strokes': strokes,
+            'strokes_per_second': round(strokes / window, 3),
+            'words_per_minute': round(max(0, characters) / 5 / (window / 60), 1),
+            'undo_rate': round(undos / strokes, 3) if strokes else 0,
+            'misstroke_rate': round(misstrokes / strokes, 3) if strokes else 0,
+            'total_strokes': total_strokes,
+            'top_outlines': [list(item) for item in top],
+        }
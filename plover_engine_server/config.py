@@ -1,10 +1,15 @@
 """Server configuration."""
 
+from typing import List
 import json
 
 
 DEFAULT_HOST: str = 'localhost'
 DEFAULT_PORT: int = 8086
+DEFAULT_MAX_CONNECTIONS: int = 0
+DEFAULT_BULK_CHUNK_SIZE: int = 16384
+DEFAULT_EVENT_LOOP: str = 'asyncio'
+DEFAULT_LOOP_LAG_INTERVAL: float = 0.1
 
 
 class ServerConfig():
@@ -13,10 +18,39 @@ class ServerConfig():
     Attributes:
         host: The host address for the server to run on.
         port: The port for the server to run on.
+        secretkey: The secret clients must send in the X-Secret-Token header.
+        ssl: The SSL configuration, empty to serve plaintext.
+        max_connections: The maximum number of concurrent connections,
+            0 for no limit.
+        rate_limit: The rate limits for inbound commands, with optional
+            `connection` and `secret` token bucket configurations.
+        bulk_chunk_size: The approximate maximum size of a single bulk message.
+        keepalive: The dead client detection settings, with optional
+            `heartbeat`, `idle_timeout`, `write_timeout` and `max_queued` keys.
+        analytics: The stroke analytics settings, with optional `enabled`,
+            `window`, `interval` and `top_outlines` keys.
+        listeners: The addresses to listen on. Each listener has the `host`,
+            `port`, `ssl`, `secretkey`, `max_connections` and `rate_limit`
+            keys, defaulting to the top level values, and an optional
+            `topics` list of the events its clients may receive.
+        event_loop: The event loop implementation, `asyncio` or an
+            alternative such as `uvloop` if it is installed.
+        loop_lag_interval: The number of seconds between two samples of the
+            event loop scheduling delay, 0 to disable the sampling.
     """
 
     host: str
     port: str
+    secretkey: str
+    ssl: dict
+    max_connections: int
+    rate_limit: dict
+    bulk_chunk_size: int
+    keepalive: dict
+    analytics: dict
+    listeners: List[dict]
+    event_loop: str
+    loop_lag_interval: float
 
     def __init__(self, file_path: str):
         """Initialize the server configuration object.
@@ -38,3 +72,22 @@ class ServerConfig():
         self.port = data.get('port', DEFAULT_PORT)
         self.secretkey = data.get('secretkey', "")
         self.ssl = data.get('ssl', {})
+        self.max_connections = data.get('max_connections', DEFAULT_MAX_CONNECTIONS)
+        self.rate_limit = data.get('rate_limit', {})
+        self.bulk_chunk_size = data.get('bulk_chunk_size', DEFAULT_BULK_CHUNK_SIZE)
+        self.keepalive = data.get('keepalive', {})
+        self.analytics = data.get('analytics') or {}
+        self.event_loop = data.get('event_loop', DEFAULT_EVENT_LOOP)
+        self.loop_lag_interval = data.get('loop_lag_interval', DEFAULT_LOOP_LAG_INTERVAL)
+
+        defaults = {
+            'host': self.host,
+            'port': self.port,
+            'ssl': self.ssl,
+            'secretkey': self.secretkey,
+            'max_connections': self.max_connections,
+            'rate_limit': self.rate_limit,
+            'topics': None,
+        }
+        self.listeners = [{**defaults, **listener}
+                          for listener in data.get('listeners') or [{}]]
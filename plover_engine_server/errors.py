@@ -3,3 +3,7 @@
 ERROR_MISSING_ENGINE = 'Plover engine not provided to web socket server'
 ERROR_SERVER_RUNNING: str = 'A server is already running'
 ERROR_NO_SERVER: str = 'A server is not currently running'
+ERROR_TOO_MANY_CONNECTIONS: str = 'Too many connections'
+ERROR_ANALYTICS_WINDOW: str = 'The analytics window must be a positive whole number of seconds'
+ERROR_ANALYTICS_TOP_OUTLINES: str = 'The number of top outlines must be a non-negative whole number'
+ERROR_ANALYTICS_INTERVAL: str = 'The analytics interval must be a non-negative number of seconds'
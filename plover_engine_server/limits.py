@@ -0,0 +1,74 @@
+"""Admission control and rate limiting."""
+
+from time import monotonic
+from typing import Optional, TypedDict
+
+
+class RateConfig(TypedDict, total=False):
+    """Configuration of a single token bucket.
+
+    Attributes:
+        rate: The number of tokens refilled per second. Zero or missing
+            disables the limit.
+        burst: The maximum number of tokens the bucket can hold. Defaults
+            to rate.
+    """
+
+    rate: float
+    burst: float
+
+
+class TokenBucket:
+    """A token bucket rate limiter.
+
+    Not thread safe, it should only be used from the server event loop.
+    """
+
+    def __init__(self, rate: float = 0, burst: Optional[float] = None):
+        """Initialize the bucket.
+
+        Args:
+            rate: The number of tokens refilled per second. If zero, the
+                bucket never runs out.
+            burst: The capacity of the bucket. Defaults to rate.
+        """
+
+        self._rate = float(rate)
+        self._burst = float(burst if burst is not None else rate)
+        self._tokens = self._burst
+        self._last = monotonic()
+
+    @classmethod
+    def from_config(cls, config: Optional[RateConfig]) -> 'TokenBucket':
+        """Creates a bucket from its configuration.
+
+        Args:
+            config: The bucket configuration, or None for an unlimited bucket.
+        """
+
+        config = config or {}
+        return cls(config.get('rate', 0), config.get('burst'))
+
+    def consume(self, tokens: float = 1) -> bool:
+        """Takes tokens out of the bucket.
+
+        Args:
+            tokens: The number of tokens to take.
+
+        Returns:
+            True if there were enough tokens, False if the caller is over
+            the limit. No tokens are taken in the latter case.
+        """
+
+        if self._rate <= 0:
+            return True
+
+        now = monotonic()
+        self._tokens = min(self._burst,
+                           self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
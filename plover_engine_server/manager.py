@@ -14,6 +14,7 @@ from plover.oslayer.config import CONFIG_DIR
 from plover.formatting import _Action
 from plover.steno_dictionary import StenoDictionaryCollection
 
+from plover_engine_server.analytics import StrokeAnalytics
 from plover_engine_server.errors import (
     ERROR_MISSING_ENGINE,
     ERROR_SERVER_RUNNING,
@@ -21,6 +22,7 @@ from plover_engine_server.errors import (
 )
 from plover_engine_server.server import (
     EngineServer,
+    MessagePriority,
     ServerStatus
 )
 from plover_engine_server.websocket.server import WebSocketServer
@@ -37,6 +39,7 @@ class EngineServerManager():
         self._server: Optional[EngineServer] = None
         self._engine: StenoEngine = engine
         self._config_path: str = os.path.join(CONFIG_DIR, SERVER_CONFIG_FILE)
+        self._analytics: Optional[StrokeAnalytics] = None
 
     def start(self):
         """Starts the server.
@@ -51,7 +54,14 @@ class EngineServerManager():
 
         self._config = ServerConfig(self._config_path)  # reload the configuration when the server is restarted
 
-        self._server = WebSocketServer(self._config.host, self._config.port, self._config.ssl, self._config.secretkey)
+        self._analytics = StrokeAnalytics.from_config(self._config.analytics)
+
+        self._server = WebSocketServer(self._config.listeners,
+                                       bulk_chunk_size=self._config.bulk_chunk_size,
+                                       keepalive=self._config.keepalive,
+                                       analytics=self._analytics,
+                                       event_loop=self._config.event_loop,
+                                       loop_lag_interval=self._config.loop_lag_interval)
         self._server.register_message_callback(self._on_message)
         self._server.start()
 
@@ -170,6 +180,13 @@ class EngineServerManager():
         data = {'stroked': json.loads(stroke_json), 'rtfcre': stroke.rtfcre}
         self._server.queue_message(data)
 
+        if self._analytics:
+            # the translator already processed the stroke when the hook is triggered
+            translations = self._engine._translator.get_state().translations
+            untranslated = (not stroke.is_correction and bool(translations)
+                            and translations[-1].english is None)
+            self._analytics.record_stroke(stroke.rtfcre, stroke.is_correction, untranslated)
+
     def _on_translated(self, old: List[_Action], new: List[_Action]):
         """Broadcasts when a new translation occurs.
 
@@ -189,6 +206,10 @@ class EngineServerManager():
         }
         self._server.queue_message(data)
 
+        if self._analytics:
+            self._analytics.record_output(sum(len(action.text or '') for action in new)
+                                          - sum(len(action.text or '') for action in old))
+
     def _on_machine_state_changed(self, machine_type: str, machine_state: str):
         """Broadcasts when the active machine state changes.
 
@@ -227,7 +248,7 @@ class EngineServerManager():
         config_json = jsonpickle.encode(config_update, unpicklable=False)
 
         data = {'config_changed': json.loads(config_json)}
-        self._server.queue_message(data)
+        self._server.queue_message(data, MessagePriority.Bulk)
 
     def _on_dictionaries_loaded(self, dictionaries: StenoDictionaryCollection):
         """Broadcasts when all of the dictionaries get loaded.
@@ -2,7 +2,15 @@
 
 from enum import Enum, auto
 from threading import Thread
+from time import monotonic
 import asyncio
+import importlib
+
+from plover import log
+
+
+# Alternative event loop implementations, by module name
+EVENT_LOOPS = ('uvloop', 'winloop')
 
 
 class ServerStatus(Enum):
@@ -17,6 +25,41 @@ class ServerStatus(Enum):
     Running = auto()
 
 
+class MessagePriority(Enum):
+    """Represents the priority class of a broadcast message.
+
+    Attributes:
+        Realtime: A small latency-critical event, such as a stroke. Always
+            sent before any pending bulk message.
+        Bulk: A large payload, such as a configuration update. May be split
+            into several messages.
+    """
+
+    Realtime = auto()
+    Bulk = auto()
+
+
+def new_event_loop(name: str = 'asyncio') -> asyncio.AbstractEventLoop:
+    """Creates an event loop.
+
+    Args:
+        name: 'asyncio' for the default implementation, or one of
+            EVENT_LOOPS. Falls back to the default implementation if the
+            alternative is unknown or not installed.
+    """
+
+    if name != 'asyncio':
+        if name in EVENT_LOOPS:
+            try:
+                return importlib.import_module(name).new_event_loop()
+            except ImportError:
+                log.warning(f'Event loop {name} is not installed, using asyncio')
+        else:
+            log.warning(f'Unknown event loop {name}, using asyncio')
+
+    return asyncio.new_event_loop()
+
+
 class EngineServer:
     """A server for the Plover engine.
 
@@ -52,20 +95,22 @@ class EngineServer:
         """Function to stop the underlying thread."""
         self._thread.join()
 
-    def queue_message(self, data: dict):
+    def queue_message(self, data: dict,
+                      priority: MessagePriority = MessagePriority.Realtime):
         """Queues a message for the server to broadcast.
 
         Assumes it is called from a thread different from the event loop.
 
         Args:
             data: The data in JSON format to broadcast.
+            priority: The priority class of the message.
         """
 
         if not self._loop:
             return
 
-        asyncio.run_coroutine_threadsafe(self._broadcast_message(data),
-                                         self._loop)
+        asyncio.run_coroutine_threadsafe(
+            self._broadcast_message(data, priority, monotonic()), self._loop)
 
     def queue_stop(self):
         """Queues the server to stop.
@@ -94,11 +139,14 @@ class EngineServer:
 
         raise NotImplementedError()
 
-    async def _broadcast_message(self, data: dict):
+    async def _broadcast_message(self, data: dict, priority: MessagePriority,
+                                 queued_at: float):
         """Broadcasts a message to connected clients.
 
         Args:
             data: The data in JSON format to broadcast.
+            priority: The priority class of the message.
+            queued_at: The time.monotonic() value when the message was queued.
         """
 
         raise NotImplementedError()
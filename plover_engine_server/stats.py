@@ -0,0 +1,123 @@
+"""Server statistics."""
+
+from collections import Counter, deque
+from typing import Dict
+import asyncio
+
+
+class LatencyRecorder:
+    """Keeps the most recent samples of a latency in fixed memory.
+
+    Attributes:
+        count: The total number of samples recorded.
+        max: The largest sample ever recorded, in seconds.
+    """
+
+    def __init__(self, size: int = 1024):
+        """Initialize the recorder.
+
+        Args:
+            size: The number of recent samples the percentiles are computed over.
+        """
+
+        self._samples = deque(maxlen=size)
+        self.count: int = 0
+        self.max: float = 0.0
+
+    def record(self, seconds: float):
+        """Records a sample.
+
+        Args:
+            seconds: The measured latency.
+        """
+
+        self._samples.append(seconds)
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self) -> dict:
+        """Returns the percentiles of the recent samples, in milliseconds."""
+
+        samples = sorted(self._samples)
+        if not samples:
+            return {'count': self.count}
+
+        def percentile(fraction: float) -> float:
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 3)
+
+        return {
+            'count': self.count,
+            'p50_ms': percentile(0.5),
+            'p90_ms': percentile(0.9),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class ServerStats:
+    """Counters describing the activity of the server.
+
+    Only meant to be updated from the server event loop.
+
+    Attributes:
+        info: Static information about the server, such as the event loop.
+        counters: The event counters, keyed by name.
+        latencies: The latency recorders, keyed by name.
+    """
+
+    def __init__(self):
+        self.info: dict = {}
+        self.counters: Counter = Counter()
+        self.latencies: Dict[str, LatencyRecorder] = {}
+
+    def incr(self, name: str, amount: int = 1):
+        """Increments a counter.
+
+        Args:
+            name: The name of the counter.
+            amount: The amount to add.
+        """
+
+        self.counters[name] += amount
+
+    def record_latency(self, name: str, seconds: float):
+        """Records a latency sample.
+
+        Args:
+            name: The name of the latency recorder.
+            seconds: The measured latency.
+        """
+
+        recorder = self.latencies.get(name)
+        if recorder is None:
+            recorder = self.latencies[name] = LatencyRecorder()
+        recorder.record(seconds)
+
+    def as_dict(self) -> dict:
+        """Returns a JSON serializable snapshot of the statistics."""
+
+        return {
+            'info': self.info,
+            'counters': dict(self.counters),
+            'latencies': {name: recorder.summary()
+                          for name, recorder in self.latencies.items()},
+        }
+
+
+async def sample_loop_lag(stats: ServerStats, interval: float):
+    """Records the scheduling delay of the running event loop, forever.
+
+    The delay is how much later than requested a sleeping task wakes up,
+    which grows when the loop is busy or blocked by a synchronous call.
+
+    Args:
+        stats: The statistics to record the `loop_lag` latency in.
+        interval: The number of seconds between two samples.
+    """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stats.record_latency('loop_lag', max(0.0, loop.time() - start - interval))
@@ -0,0 +1,462 @@
+"""Connected clients and their outbound lanes."""
+
+from collections import deque
+from time import monotonic
+from typing import FrozenSet, Optional, TypedDict
+import asyncio
+import json
+import socket
+
+from aiohttp import web
+
+from plover import log
+
+from plover_engine_server.server import MessagePriority
+from plover_engine_server.stats import ServerStats
+
+
+def encode_frames(data: dict, priority: MessagePriority, chunk_size: int) -> list:
+    """Encodes a message once for all clients.
+
+    A bulk message made of a single event whose value is an object, such as
+    `config_changed`, is split into several messages of the same event, each
+    carrying a part of the object, so that no single frame holds the socket
+    for long.
+
+    Args:
+        data: The data in JSON format to encode.
+        priority: The priority class of the message.
+        chunk_size: The approximate maximum size of a bulk frame.
+
+    Returns:
+        The encoded frames, in order.
+    """
+
+    if priority != MessagePriority.Bulk or len(data) != 1:
+        return [json.dumps(data)]
+
+    (event, value), = data.items()
+    if not isinstance(value, dict):
+        return [json.dumps(data)]
+
+    frames = []
+    parts = []
+    size = 0
+    for key, item in value.items():
+        part = f'{json.dumps(key)}: {json.dumps(item)}'
+        if parts and size + len(part) > chunk_size:
+            frames.append(parts)
+            parts = []
+            size = 0
+        parts.append(part)
+        size += len(part) + 2
+
+    if parts or not frames:
+        frames.append(parts)
+
+    prefix = '{' + json.dumps(event) + ': {'
+    return [prefix + ', '.join(parts) + '}}' for parts in frames]
+
+
+class KeepaliveConfig(TypedDict, total=False):
+    """Configuration of the dead peer detection.
+
+    Attributes:
+        heartbeat: The number of seconds between pings, 0 to disable.
+        idle_timeout: The number of seconds without any frame from a
+            WebSocket client, pongs included, before it is disconnected,
+            0 to disable.
+        write_timeout: The number of seconds a single send may take before
+            the client is disconnected, 0 to disable.
+        max_queued: The number of frames that may be pending for a client
+            before it is disconnected, 0 for no limit.
+    """
+
+    heartbeat: float
+    idle_timeout: float
+    write_timeout: float
+    max_queued: int
+
+
+DEFAULT_KEEPALIVE: KeepaliveConfig = {
+    'heartbeat': 10,
+    'idle_timeout': 60,
+    'write_timeout': 10,
+    'max_queued': 1024,
+}
+
+
+class Peer:
+    """A connected client with one outbound lane per message priority.
+
+    Frames are written by a dedicated task, so that a broadcast never waits
+    on a slow client, and a realtime frame is always written before any
+    pending bulk frame. Every frame is flushed out of the transport buffer
+    before the next one is chosen, so the recorded latencies run from
+    queue_message until the frame reaches the kernel socket buffer, and
+    bulk frames never pile up in front of a realtime one. A client which
+    cannot keep up, or whose sends time out, is aborted right away instead
+    of being written to until the operating system notices. Subclasses
+    implement the transport.
+
+    Attributes:
+        response: The underlying response streaming to the client.
+        topics: The events the client subscribed to, or None for all events.
+    """
+
+    # whether the writer task sends pings itself when idle, see _send_ping
+    _sends_pings = False
+
+    def __init__(self, request: web.Request, response: web.StreamResponse,
+                 stats: ServerStats, topics: Optional[FrozenSet[str]] = None,
+                 keepalive: Optional[KeepaliveConfig] = None):
+        """Initialize the peer.
+
+        Args:
+            request: The request from the client.
+            response: The prepared response streaming to the client.
+            stats: The statistics to record delivery latencies in.
+            topics: The events the client subscribed to, or None for all events.
+            keepalive: The dead peer detection configuration.
+        """
+
+        keepalive = {**DEFAULT_KEEPALIVE, **(keepalive or {})}
+
+        self.response = response
+        self.topics = topics
+        self._request = request
+        self._stats = stats
+        self._keepalive = keepalive
+        self._write_timeout = keepalive['write_timeout'] or None
+        self._max_queued = keepalive['max_queued']
+        self._ping_interval = (keepalive['heartbeat'] or None) if self._sends_pings else None
+        self._realtime = deque()
+        self._bulk = deque()
+        self._wakeup = asyncio.Event()
+        self._sending_bulk = False
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def wants(self, topic: str) -> bool:
+        """Returns whether the client subscribed to an event.
+
+        Args:
+            topic: The name of the event.
+        """
+
+        return self.topics is None or topic in self.topics
+
+    def start(self):
+        """Starts the writer task."""
+
+        transport = self._request.transport
+        if transport is not None:
+            # pause the protocol as soon as anything stays buffered, so that
+            # _flush waits until the frame was handed to the kernel
+            transport.set_write_buffer_limits(high=0)
+        self._task = asyncio.ensure_future(self._write_loop())
+
+    async def stop(self):
+        """Stops the writer task, dropping any pending frames."""
+
+        self._closed = True
+        self._realtime.clear()
+        self._bulk.clear()
+
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def join(self):
+        """Waits until the writer task ends, which happens when sending fails."""
+
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def close(self, **kwargs):
+        """Stops the writer task and closes the connection.
+
+        Args:
+            kwargs: Transport specific closing arguments.
+        """
+
+        await self.stop()
+
+    def abort(self):
+        """Drops the connection immediately, along with any pending frames.
+
+        The handler of the connection notices the lost connection and
+        unregisters the peer.
+        """
+
+        self._closed = True
+        self._realtime.clear()
+        self._bulk.clear()
+        transport = self._request.transport
+        if transport is not None:
+            transport.abort()
+
+    def enqueue(self, frame: str, priority: MessagePriority, queued_at: float):
+        """Queues an encoded frame for sending.
+
+        Args:
+            frame: The encoded frame.
+            priority: The priority class of the frame.
+            queued_at: The time.monotonic() value when the message was queued.
+        """
+
+        if self._closed:
+            return
+
+        if self._max_queued and len(self._realtime) + len(self._bulk) >= self._max_queued:
+            self._stats.incr('queue_overflows')
+            log.info(f'Dropping {self!r}, which is not keeping up')
+            self.abort()
+            return
+
+        if priority == MessagePriority.Bulk:
+            self._bulk.append((frame, queued_at))
+        else:
+            behind_bulk = self._sending_bulk or bool(self._bulk)
+            self._realtime.append((frame, queued_at, behind_bulk))
+        self._wakeup.set()
+
+    async def _send(self, frame: str):
+        raise NotImplementedError()
+
+    async def _send_ping(self):
+        pass
+
+    async def _flush(self):
+        # without this, up to the transport buffer limit of bulk frames could
+        # sit between a realtime frame and the client once _send returned
+        writer = self.response._payload_writer
+        if writer is not None:
+            await writer.drain()
+
+    async def _write(self, send):
+        async def write():
+            await send
+            await self._flush()
+
+        await asyncio.wait_for(write(), self._write_timeout)
+
+    async def _write_loop(self):
+        try:
+            # wait_for may swallow a cancellation which races with a completed
+            # send, so the closed flag is what reliably ends the loop
+            while not self._closed:
+                if not self._realtime and not self._bulk:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self._ping_interval)
+                    except asyncio.TimeoutError:
+                        await self._write(self._send_ping())
+                    continue
+
+                if self._realtime:
+                    frame, queued_at, behind_bulk = self._realtime.popleft()
+                    await self._write(self._send(frame))
+                    latency = monotonic() - queued_at
+                    self._stats.record_latency('realtime', latency)
+                    if behind_bulk:
+                        self._stats.record_latency('realtime_during_bulk', latency)
+                else:
+                    frame, queued_at = self._bulk.popleft()
+                    self._sending_bulk = True
+                    try:
+                        await self._write(self._send(frame))
+                    finally:
+                        self._sending_bulk = False
+                    self._stats.record_latency('bulk', monotonic() - queued_at)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._stats.incr('write_timeouts')
+            log.info(f'Timed out sending to {self!r}')
+            self.abort()
+        except Exception as e:
+            self._stats.incr('send_failures')
+            log.info(f'Failed to send to {self!r}: {e!r}')
+            self.abort()
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} {id(self):#x}>'
+
+
+class WebSocketPeer(Peer):
+    """A client connected with a WebSocket.
+
+    Pings and the idle timeout are handled by the WebSocketResponse itself,
+    see `websocket_response`.
+    """
+
+    async def close(self, **kwargs):
+        """Stops the writer task and closes the socket.
+
+        Args:
+            kwargs: Passed to WebSocketResponse.close.
+        """
+
+        await self.stop()
+        await self.response.close(**kwargs)
+
+    async def _send(self, frame: str):
+        await self.response.send_str(frame)
+
+
+def websocket_response(keepalive: Optional[KeepaliveConfig] = None) -> web.WebSocketResponse:
+    """Creates a WebSocket response which detects dead peers.
+
+    Args:
+        keepalive: The dead peer detection configuration.
+    """
+
+    keepalive = {**DEFAULT_KEEPALIVE, **(keepalive or {})}
+    return web.WebSocketResponse(
+        heartbeat=keepalive['heartbeat'] or None,
+        receive_timeout=keepalive['idle_timeout'] or None,
+        # also bounds the wait for the closing handshake of a dead peer
+        timeout=keepalive['write_timeout'] or 10.0,
+    )
+
+
+class EventStreamPeer(Peer):
+    """A client connected with Server-Sent Events.
+
+    Each frame is sent as the data of an unnamed event, so the browser
+    EventSource API delivers it through onmessage. When idle, a comment
+    line is sent every heartbeat, which keeps proxies from closing the
+    stream.
+
+    A few bytes every heartbeat never fill the socket buffers of a peer
+    which vanished, so the write timeout cannot detect it. Instead the
+    kernel is told to give up on the connection once sent data stays
+    unacknowledged for idle_timeout, after which the next ping fails.
+    """
+
+    _sends_pings = True
+
+    def start(self):
+        """Starts the writer task."""
+
+        transport = self._request.transport
+        if transport is not None and self._keepalive['idle_timeout']:
+            set_dead_peer_timeout(transport.get_extra_info('socket'),
+                                  self._keepalive['idle_timeout'],
+                                  self._keepalive['heartbeat'])
+        super().start()
+
+    async def _send(self, frame: str):
+        await self.response.write(f'data: {frame}\n\n'.encode('utf-8'))
+
+    async def _send_ping(self):
+        await self.response.write(b': ping\n\n')
+
+
+def set_dead_peer_timeout(sock, timeout: float, probe_interval: float = 0):
+    """Makes the kernel drop a TCP connection whose peer stopped answering.
+
+    Uses TCP_USER_TIMEOUT where available (Linux), and TCP keepalive
+    probes so that a connection with nothing in flight is checked too.
+
+    Args:
+        sock: The socket of the connection, or None if there is none.
+        timeout: The number of seconds sent data may stay unacknowledged.
+        probe_interval: The number of seconds between keepalive probes,
+            0 to keep the system default.
+    """
+
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_USER_TIMEOUT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(timeout * 1000))
+        if probe_interval and hasattr(socket, 'TCP_KEEPIDLE'):
+            interval = max(1, int(probe_interval))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    except OSError as e:
+        log.info(f'Could not set the dead peer timeout: {e!r}')
+
+
+class EventLog:
+    """A bounded log of recently broadcast frames, shared by long-poll clients.
+
+    Every frame gets a sequence number, which clients use as a cursor, so
+    that no per-client state is kept between polls.
+    """
+
+    def __init__(self, size: int = 1024):
+        """Initialize the log.
+
+        Args:
+            size: The number of recent frames to keep.
+        """
+
+        self._frames = deque(maxlen=size)
+        self._next = 0
+        self._appended = asyncio.Event()
+
+    @property
+    def next(self) -> int:
+        """The sequence number of the next frame to be appended."""
+
+        return self._next
+
+    def append(self, topic: str, frame: str):
+        """Appends a frame and wakes up the waiting clients.
+
+        Args:
+            topic: The name of the event.
+            frame: The encoded frame.
+        """
+
+        self._frames.append((self._next, topic, frame))
+        self._next += 1
+        self._appended.set()
+        self._appended = asyncio.Event()
+
+    def read(self, since: int, topics: Optional[FrozenSet[str]] = None):
+        """Reads the frames appended since a cursor.
+
+        Args:
+            since: The sequence number of the first frame to read.
+            topics: The events to read, or None for all events.
+
+        Returns:
+            The frames, and the number of frames since the cursor which
+            were already dropped from the log.
+        """
+
+        missed = 0
+        if self._frames:
+            missed = max(0, self._frames[0][0] - since)
+
+        frames = [frame for seq, topic, frame in self._frames
+                  if seq >= since and (topics is None or topic in topics)]
+        return frames, missed
+
+    async def wait(self, since: int, timeout: float):
+        """Waits until a frame is appended at or after a cursor.
+
+        Args:
+            since: The sequence number to wait for.
+            timeout: The maximum number of seconds to wait.
+        """
+
+        if since < self._next:
+            return
+
+        try:
+            await asyncio.wait_for(self._appended.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
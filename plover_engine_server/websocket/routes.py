@@ -3,13 +3,23 @@
 from aiohttp import web
 
 
+# The read-only streaming routes, which also accept the secret key as a query parameter
+STREAM_ROUTES = ('/events', '/poll')
+
+
 def setup_routes(app: web.Application):
     """Sets up the routes for the web server.
 
     Args:
         app: The web server.
     """
-    from plover_engine_server.websocket.views import index, protocol, websocket_handler
+    from plover_engine_server.websocket.views import (
+        index, protocol, stats, analytics, websocket_handler, events_handler, poll_handler
+    )
     app.router.add_get('/', index)
     app.router.add_get('/protocol', protocol)
+    app.router.add_get('/stats', stats)
+    app.router.add_get('/analytics', analytics)
     app.router.add_get('/websocket', websocket_handler)
+    app.router.add_get('/events', events_handler)
+    app.router.add_get('/poll', poll_handler)
@@ -1,6 +1,8 @@
 """WebSocket server definition."""
 
+from time import monotonic
 import asyncio
+import hmac
 
 from aiohttp import web, WSCloseCode
 import ssl
@@ -11,11 +13,17 @@ from plover_engine_server.errors import (
 )
 from plover_engine_server.server import (
     EngineServer,
-    ServerStatus
+    MessagePriority,
+    ServerStatus,
+    new_event_loop
 )
-from plover_engine_server.websocket.routes import setup_routes
+from plover_engine_server.analytics import StrokeAnalytics
+from plover_engine_server.limits import RateConfig, TokenBucket
+from plover_engine_server.stats import ServerStats, sample_loop_lag
+from plover_engine_server.websocket.peer import EventLog, KeepaliveConfig, encode_frames
+from plover_engine_server.websocket.routes import STREAM_ROUTES, setup_routes
 
-from typing import TypedDict, Callable
+from typing import Dict, List, Optional, TypedDict, Callable
 
 class APIContext(TypedDict):
     ssl: bool
@@ -24,35 +32,81 @@ class SSLConfig(TypedDict):
     cert_path: str
     key_path: str
 
-class WebSocketServer(EngineServer):
-    """A server based on WebSockets."""
+class RateLimitConfig(TypedDict, total=False):
+    connection: RateConfig
+    secret: RateConfig
+    poll: RateConfig
+
+class ListenerConfig(TypedDict, total=False):
+    host: str
+    port: int
+    ssl: SSLConfig
+    secretkey: str
+    topics: Optional[List[str]]
+    max_connections: int
+    rate_limit: RateLimitConfig
 
-    _ssl: SSLConfig
-    _app: web.Application
-    _secretkey: str
-    def __init__(self, host: str, port: str, ssl: dict, secretkey: str):
+class WebSocketServer(EngineServer):
+    """A server based on WebSockets.
+
+    Every listener is served by its own web application with its own
+    policy, but all of them run on the same event loop and share the
+    broadcast pipeline, so each event is encoded once for all listeners.
+    """
+
+    _listeners: List[ListenerConfig]
+    _apps: List[web.Application]
+    def __init__(self, listeners: List[ListenerConfig],
+                 bulk_chunk_size: int = 16384,
+                 keepalive: Optional[KeepaliveConfig] = None,
+                 analytics: Optional[StrokeAnalytics] = None,
+                 event_loop: str = 'asyncio',
+                 loop_lag_interval: float = 0.1):
         """Initialize the server.
 
         Args:
-            host: The host address for the server to run on.
-            port: The port for the server to run on.
+            listeners: The addresses to listen on, each with its SSL
+                configuration, secret key, allowed event topics, connection
+                limit and rate limits. The first one is the primary listener.
+            bulk_chunk_size: The approximate maximum size of a bulk frame.
+            keepalive: The heartbeat, timeouts and queue limit used to detect
+                dead clients.
+            analytics: The stroke analytics to serve and periodically
+                broadcast, if enabled.
+            event_loop: The event loop implementation to run the server on,
+                see new_event_loop.
+            loop_lag_interval: The number of seconds between two samples of
+                the event loop scheduling delay, 0 to disable the sampling.
         """
 
-        super().__init__(host, port)
-        self._app = None
-        self._ssl = ssl
-        self._secretkey = secretkey
+        super().__init__(listeners[0]['host'], listeners[0]['port'])
+        self._listeners = listeners
+        self._apps = []
+        self._bulk_chunk_size = bulk_chunk_size
+        self._keepalive = keepalive or {}
+        self._analytics = analytics
+        self._event_loop = event_loop
+        self._loop_lag_interval = loop_lag_interval
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self.stats = ServerStats()
 
     async def secret_auth_middleware(self, app, handler: Callable):
         async def middleware(request: web.Request):
             # Get the secret token from the request (you can use headers, query params, etc.)
             provided_secret = request.headers.get('X-Secret-Token')
-
-            if provided_secret == self._secretkey:
+            if provided_secret is None and request.path in STREAM_ROUTES:
+                # EventSource cannot set headers, so the read-only routes also accept a query parameter
+                provided_secret = request.query.get('token')
+
+            # compare_digest does not leak the length of the matching prefix through timing,
+            # and headers which are not valid UTF-8 were decoded with surrogateescape
+            if provided_secret is not None and hmac.compare_digest(
+                    provided_secret.encode('utf-8', 'surrogateescape'), app['secret']):
                 # Secret matches, proceed with the request
                 return await handler(request)
             else:
                 # Secret doesn't match, return a 403 Forbidden response
+                self.stats.incr('auth_failures')
                 return web.Response(status=403, text='Forbidden')
 
         return middleware
@@ -60,13 +114,71 @@ class WebSocketServer(EngineServer):
     async def context_middleware(self, app, handler: Callable):
         async def middleware(request: web.Request):
             # Inject ssl bool into the request context
-            context: APIContext = {'ssl': True if (self._ssl) else False}
+            context: APIContext = {'ssl': True if (app['listener'].get('ssl')) else False}
 
             # Proceed with the request
             return await handler(request, context)
 
         return middleware
 
+    def _shared_bucket(self, kind: str, secret: bytes,
+                       config: Optional[RateConfig]) -> TokenBucket:
+        """Gets the rate limiter of a secret key.
+
+        Listeners sharing a secret key and a limit share the bucket, so that
+        serving a secret on several listeners does not multiply its rate.
+
+        Args:
+            kind: The kind of requests the bucket limits.
+            secret: The encoded secret key.
+            config: The bucket configuration.
+        """
+
+        config = config or {}
+        key = (kind, secret, config.get('rate', 0), config.get('burst'))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket.from_config(config)
+        return bucket
+
+    def _create_app(self, listener: ListenerConfig, event_log: EventLog) -> web.Application:
+        """Creates the web application serving a listener.
+
+        Args:
+            listener: The configuration of the listener.
+            event_log: The long-poll event log shared by all listeners.
+        """
+
+        app = web.Application(middlewares=[self.secret_auth_middleware, self.context_middleware])
+
+        async def on_shutdown(app):
+            for peer in set(app['peers']):
+                await peer.close()
+        app.on_shutdown.append(on_shutdown)
+
+        rate_limit = listener.get('rate_limit') or {}
+        topics = listener.get('topics')
+
+        app['listener'] = listener
+        # encoded once, so that the per request check is a single constant-time comparison
+        app['secret'] = listener.get('secretkey', '').encode('utf-8')
+        app['peers'] = set()
+        app['allowed_topics'] = frozenset(topics) if topics is not None else None
+        app['keepalive'] = self._keepalive
+        app['event_log'] = event_log
+        app['analytics'] = self._analytics
+        app['on_message_callback'] = self._on_message
+        app['stats'] = self.stats
+        app['max_connections'] = listener.get('max_connections', 0)
+        app['connection_rate'] = rate_limit.get('connection')
+        app['secret_bucket'] = self._shared_bucket('secret', app['secret'], rate_limit.get('secret'))
+        # polls have their own budget, so that read-only clients cannot starve the engine commands
+        app['poll_bucket'] = self._shared_bucket('poll', app['secret'], rate_limit.get('poll'))
+
+        setup_routes(app)
+        app.on_shutdown.append(self._on_server_shutdown)
+        return app
+
     def _start(self):
         """Starts the server.
 
@@ -75,42 +187,59 @@ class WebSocketServer(EngineServer):
         if self.status == ServerStatus.Running:
             raise AssertionError(ERROR_SERVER_RUNNING)
 
-        loop = asyncio.new_event_loop()
+        loop = new_event_loop(self._event_loop)
         asyncio.set_event_loop(loop)
         self._loop = loop
+        self.stats.info['event_loop'] = f'{type(loop).__module__}.{type(loop).__qualname__}'
 
-        self._app = web.Application(middlewares=[self.secret_auth_middleware, self.context_middleware])
-
-        async def on_shutdown(app):
-            for ws in set(app['websockets']):
-                await ws.close()
-        self._app.on_shutdown.append(on_shutdown)
-
-        self._app['websockets'] = []
-        self._app['on_message_callback'] = self._on_message
-
-        setup_routes(self._app)
-        self._app.on_shutdown.append(self._on_server_shutdown)
+        event_log = EventLog()
+        self._buckets = {}
+        apps = [self._create_app(listener, event_log) for listener in self._listeners]
 
         self._stop_event = asyncio.Event()
 
         async def run_async():
-            self._runner = runner = web.AppRunner(self._app)
-            await runner.setup()
-
-            if self._ssl:
-                # Load your SSL certificate and private key
-                ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-                ssl_context.load_cert_chain(self._ssl.get('cert_path'), self._ssl.get('key_path'))
-            else:
-                ssl_context = None
+            runners = []
+            try:
+                for app in apps:
+                    runner = web.AppRunner(app)
+                    await runner.setup()
+                    runners.append(runner)
+
+                    listener = app['listener']
+                    ssl_config = listener.get('ssl')
+                    if ssl_config:
+                        # Load your SSL certificate and private key
+                        ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+                        ssl_context.load_cert_chain(ssl_config.get('cert_path'), ssl_config.get('key_path'))
+                    else:
+                        ssl_context = None
+
+                    site = web.TCPSite(runner, host=listener['host'], port=listener['port'], ssl_context=ssl_context)
+                    await site.start()
+            except:
+                # do not leave the listeners which did start bound
+                for runner in runners:
+                    await runner.cleanup()
+                self._loop = None
+                raise
 
-            self._site = site = web.TCPSite(runner, host=self._host, port=self._port, ssl_context=ssl_context)
-            await site.start()
+            self._apps = apps
             self.status = ServerStatus.Running
+
+            background = []
+            if self._analytics and self._analytics.interval:
+                background.append(asyncio.ensure_future(self._publish_analytics()))
+            if self._loop_lag_interval:
+                background.append(asyncio.ensure_future(
+                    sample_loop_lag(self.stats, self._loop_lag_interval)))
+
             await self._stop_event.wait()
-            await runner.cleanup()
-            self._app = None
+            for task in background:
+                task.cancel()
+            for runner in runners:
+                await runner.cleanup()
+            self._apps = []
             self._loop = None
             self.status = ServerStatus.Stopped
 
@@ -127,6 +256,15 @@ class WebSocketServer(EngineServer):
 
         self._stop_event.set()
 
+    async def _publish_analytics(self):
+        """Periodically broadcasts the summary of the stroke analytics."""
+
+        while True:
+            await asyncio.sleep(self._analytics.interval)
+            # small enough to be sent as a whole, which bulk messages are not
+            await self._broadcast_message({'analytics': self._analytics.summary()},
+                                          MessagePriority.Realtime, monotonic())
+
     async def _on_server_shutdown(self, app: web.Application):
         """Handles pre-shutdown behavior for the server.
 
@@ -134,24 +272,38 @@ class WebSocketServer(EngineServer):
             app: The web application shutting down.
         """
 
-        for socket in app.get('websockets', []):
-            await socket.close(code=WSCloseCode.GOING_AWAY,
-                               message='Server shutdown')
+        for peer in list(app.get('peers', ())):
+            await peer.close(code=WSCloseCode.GOING_AWAY,
+                             message='Server shutdown')
 
-    async def _broadcast_message(self, data: dict):
+    async def _broadcast_message(self, data: dict, priority: MessagePriority,
+                                 queued_at: float):
         """Broadcasts a message to connected clients.
 
+        The message is encoded once, appended to the long-poll event log,
+        then queued on the lane of its priority for every client of every
+        listener subscribed to it. Each client's writer task does the
+        actual sending.
+
         Args:
-            data: The data to broadcast. Internally it's sent with WebSocketResponse.send_json.
+            data: The data to broadcast.
+            priority: The priority class of the message.
+            queued_at: The time.monotonic() value when the message was queued.
         """
 
-        if not self._app:
+        if not self._apps:
             return
 
-        sockets=self._app.get('websockets', [])
-        for socket in sockets:
-            try:
-                await socket.send_json(data)
-            except:
-                print(f'Failed to update websocket {socket} {id(socket)} {socket.closed} (this should not happen)', flush=True)
-        sockets[:]=[socket for socket in sockets if not socket.closed] #this should not change sockets normally
+        topic = next(iter(data), None)
+        frames = encode_frames(data, priority, self._bulk_chunk_size)
+
+        event_log = self._apps[0]['event_log']
+        for frame in frames:
+            event_log.append(topic, frame)
+
+        for app in self._apps:
+            for peer in app['peers']:
+                if not peer.wants(topic):
+                    continue
+                for frame in frames:
+                    peer.enqueue(frame, priority, queued_at)
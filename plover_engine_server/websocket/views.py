@@ -4,7 +4,51 @@ from aiohttp import web, WSMsgType
 import asyncio
 from plover import log
 from http import HTTPStatus
+from time import monotonic
+from typing import FrozenSet, Optional
+from plover_engine_server.errors import ERROR_TOO_MANY_CONNECTIONS
+from plover_engine_server.limits import TokenBucket
 from plover_engine_server.websocket.server import APIContext
+from plover_engine_server.websocket.peer import WebSocketPeer, EventStreamPeer, websocket_response
+
+# The maximum number of seconds a long-poll request waits for events
+POLL_TIMEOUT: float = 30
+# The number of seconds to wait for more events once one arrives, so that bursts are returned together
+POLL_BATCH_DELAY: float = 0.05
+
+def _subscribed_topics(request: web.Request) -> Optional[FrozenSet[str]]:
+    """Gets the events a client subscribed to.
+
+    Args:
+        request: The request from the client, with a comma separated
+            `events` query parameter.
+
+    Returns:
+        The names of the events, restricted to the ones the listener allows,
+        or None if the client subscribed to all events.
+    """
+
+    allowed = request.app['allowed_topics']
+    events = request.query.get('events')
+    if not events:
+        return allowed
+
+    topics = frozenset(event.strip() for event in events.split(',') if event.strip())
+    return topics if allowed is None else topics & allowed
+
+def _admit(request: web.Request) -> bool:
+    """Checks whether a new streaming connection is under the connection limit.
+
+    Args:
+        request: The request from the client.
+    """
+
+    max_connections = request.app['max_connections']
+    if max_connections and len(request.app['peers']) >= max_connections:
+        # rejected before the upgrade, so that the rejected peer costs nothing more
+        request.app['stats'].incr('connections_rejected')
+        return False
+    return True
 
 async def index(request: web.Request) -> web.Response:
     """Index endpoint for the server. Not really needed.
@@ -36,6 +80,37 @@ async def protocol(request: web.Request, context: APIContext) -> web.Response:
     return web.json_response(data)
 
 
+async def stats(request: web.Request, context: APIContext) -> web.Response:
+    """Route to get the statistics of the web server.
+
+    The statistics cover every listener, so they are not served by
+    listeners restricted to some topics.
+
+    Args:
+        request: The request from the client.
+    """
+
+    if request.app['allowed_topics'] is not None:
+        return web.Response(status=HTTPStatus.NOT_FOUND, text=HTTPStatus.NOT_FOUND.phrase)
+
+    return web.json_response(request.app['stats'].as_dict())
+
+
+async def analytics(request: web.Request, context: APIContext) -> web.Response:
+    """Route to get the summary of the stroke analytics.
+
+    Args:
+        request: The request from the client.
+    """
+
+    stroke_analytics = request.app['analytics']
+    allowed = request.app['allowed_topics']
+    if stroke_analytics is None or (allowed is not None and 'analytics' not in allowed):
+        return web.Response(status=HTTPStatus.NOT_FOUND, text=HTTPStatus.NOT_FOUND.phrase)
+
+    return web.json_response(stroke_analytics.summary())
+
+
 async def websocket_handler(request: web.Request, context=None) -> web.WebSocketResponse:
     """The main WebSocket handler.
 
@@ -43,11 +118,21 @@ async def websocket_handler(request: web.Request, context=None) -> web.WebSocket
         request: The request from the client.
     """
 
+    if not _admit(request):
+        return web.Response(status=HTTPStatus.SERVICE_UNAVAILABLE, text=ERROR_TOO_MANY_CONNECTIONS)
+
+    peers = request.app['peers']
+    server_stats = request.app['stats']
+    keepalive = request.app['keepalive']
+
     log.info('WebSocket connection starting')
-    socket = web.WebSocketResponse()
+    socket = websocket_response(keepalive)
     await socket.prepare(request)
-    sockets = request.app['websockets']
-    sockets.append(socket)
+    peer = WebSocketPeer(request, socket, server_stats, _subscribed_topics(request), keepalive)
+    peer.start()
+    peers.add(peer)
+    connection_bucket = TokenBucket.from_config(request.app['connection_rate'])
+    secret_bucket = request.app['secret_bucket']
     log.info('WebSocket connection ready')
 
     try:
@@ -57,6 +142,11 @@ async def websocket_handler(request: web.Request, context=None) -> web.WebSocket
                     await socket.close()
                     continue
 
+                # checked before parsing, so that flooding costs as little as possible
+                if not (connection_bucket.consume() and secret_bucket.consume()):
+                    server_stats.incr('messages_rate_limited')
+                    continue
+
                 import json
                 try:  # NOTE is this good API? What if message is not JSON/dict?
                     data = json.loads(message.data)
@@ -66,21 +156,113 @@ async def websocket_handler(request: web.Request, context=None) -> web.WebSocket
 
                 if isinstance(data, dict):
                     callback = request.app['on_message_callback']
+                    # the callback blocks the event loop, so its duration is recorded apart from the loop lag
+                    started = monotonic()
                     try:
                         callback(data)
                     except:
                         import traceback
                         traceback.print_exc()
+                    server_stats.record_latency('on_message', monotonic() - started)
 
             elif message.type == WSMsgType.ERROR:
                 log.info('WebSocket connection closed with exception '
                       f'{socket.exception()}')
     except asyncio.CancelledError:  # https://github.com/aio-libs/aiohttp/issues/1768
         pass
+    except asyncio.TimeoutError:
+        server_stats.incr('idle_timeouts')
+        log.info('WebSocket connection timed out')
     finally:
-        await socket.close()
-
+        peers.discard(peer)
+        await peer.close()
 
-    sockets.remove(socket)
     log.info('WebSocket connection closed')
     return socket
+
+
+async def events_handler(request: web.Request, context=None) -> web.StreamResponse:
+    """The Server-Sent Events handler.
+
+    Streams the same events as the WebSocket handler, read only.
+
+    Args:
+        request: The request from the client.
+    """
+
+    if not _admit(request):
+        return web.Response(status=HTTPStatus.SERVICE_UNAVAILABLE, text=ERROR_TOO_MANY_CONNECTIONS)
+
+    peers = request.app['peers']
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # disable buffering in nginx-like proxies
+    })
+    await response.prepare(request)
+    peer = EventStreamPeer(request, response, request.app['stats'], _subscribed_topics(request),
+                           request.app['keepalive'])
+    peer.start()
+    peers.add(peer)
+    log.info('Event stream ready')
+
+    try:
+        await peer.join()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        peers.discard(peer)
+        await peer.close()
+
+    log.info('Event stream closed')
+    return response
+
+
+async def poll_handler(request: web.Request, context=None) -> web.Response:
+    """The long-poll handler.
+
+    Returns the batch of events broadcast after the `since` cursor, waiting
+    up to `timeout` seconds for one if there is none yet. The response is
+    `{"next": cursor, "missed": count, "events": [...]}`, where `next` is
+    the cursor for the next poll and `missed` the number of events which
+    were dropped from the log before this poll.
+
+    Args:
+        request: The request from the client.
+    """
+
+    server_stats = request.app['stats']
+    if not request.app['poll_bucket'].consume():
+        server_stats.incr('polls_rate_limited')
+        return web.Response(status=HTTPStatus.TOO_MANY_REQUESTS, text=HTTPStatus.TOO_MANY_REQUESTS.phrase)
+
+    event_log = request.app['event_log']
+    try:
+        since = min(int(request.query.get('since', event_log.next)), event_log.next)
+        timeout = max(0.0, min(float(request.query.get('timeout', POLL_TIMEOUT)), POLL_TIMEOUT))
+    except ValueError:
+        return web.Response(status=HTTPStatus.BAD_REQUEST, text=HTTPStatus.BAD_REQUEST.phrase)
+    if since < 0:
+        return web.Response(status=HTTPStatus.BAD_REQUEST, text=HTTPStatus.BAD_REQUEST.phrase)
+    topics = _subscribed_topics(request)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    waited = False
+    while True:
+        frames, missed = event_log.read(since, topics)
+        remaining = deadline - loop.time()
+        if frames or missed or remaining <= 0:
+            break
+        await event_log.wait(event_log.next, remaining)
+        waited = True
+
+    if frames and waited:
+        await asyncio.sleep(POLL_BATCH_DELAY)
+        frames, missed = event_log.read(since, topics)
+
+    server_stats.incr('polls')
+    # the frames are already encoded, so the body is assembled without encoding them again
+    body = f'{{"next": {event_log.next}, "missed": {missed}, "events": [{", ".join(frames)}]}}'
+    return web.Response(text=body, content_type='application/json')
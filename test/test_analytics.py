@@ -0,0 +1,77 @@
+"""Tests for the stroke analytics."""
+
+import pytest
+
+from plover_engine_server import analytics
+from plover_engine_server.analytics import StrokeAnalytics
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(analytics, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_from_config_disabled():
+    assert StrokeAnalytics.from_config(None) is None
+    assert StrokeAnalytics.from_config({}) is None
+    assert StrokeAnalytics.from_config({'enabled': False}) is None
+
+
+def test_from_config():
+    stroke_analytics = StrokeAnalytics.from_config({'enabled': True, 'interval': 2})
+    assert stroke_analytics.interval == 2
+
+
+@pytest.mark.parametrize('config', [
+    {'window': 0},
+    {'window': 'a'},
+    {'top_outlines': -1},
+    {'top_outlines': None},
+    {'interval': -1},
+    {'interval': True},
+])
+def test_from_config_invalid(config):
+    with pytest.raises(ValueError):
+        StrokeAnalytics.from_config({'enabled': True, **config})
+
+
+def test_no_top_outlines(clock):
+    stroke_analytics = StrokeAnalytics.from_config({'enabled': True, 'top_outlines': 0})
+    for outline in ('A', 'B', 'A'):
+        stroke_analytics.record_stroke(outline)
+
+    summary = stroke_analytics.summary()
+    assert summary['strokes'] == 3
+    assert summary['top_outlines'] == []
+
+
+def test_top_outlines(clock):
+    stroke_analytics = StrokeAnalytics(top_outlines=1)
+    for outline in 'ABACDEFGA':
+        stroke_analytics.record_stroke(outline)
+
+    assert stroke_analytics.summary()['top_outlines'] == [['A', 3]]
+
+
+def test_window(clock):
+    stroke_analytics = StrokeAnalytics(window=10)
+    stroke_analytics.record_stroke('A', undo=True)
+    stroke_analytics.record_output(50)
+    clock[0] += 5
+    stroke_analytics.record_stroke('B', untranslated=True)
+
+    summary = stroke_analytics.summary()
+    assert summary['window'] == 5
+    assert summary['strokes'] == 2
+    assert summary['undo_rate'] == 0.5
+    assert summary['misstroke_rate'] == 0.5
+    assert summary['words_per_minute'] == 120
+
+    clock[0] += 8
+    summary = stroke_analytics.summary()
+    assert summary['window'] == 10
+    assert summary['strokes'] == 1
+    assert summary['words_per_minute'] == 0
+    assert summary['total_strokes'] == 2
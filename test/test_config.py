@@ -0,0 +1,64 @@
+"""Tests for the server configuration."""
+
+import json
+
+from plover_engine_server.config import DEFAULT_HOST, DEFAULT_PORT, ServerConfig
+
+
+def load(tmp_path, data) -> ServerConfig:
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return ServerConfig(str(path))
+
+
+def test_missing_file(tmp_path):
+    config = ServerConfig(str(tmp_path / 'missing.json'))
+    assert config.listeners == [{
+        'host': DEFAULT_HOST,
+        'port': DEFAULT_PORT,
+        'ssl': {},
+        'secretkey': '',
+        'max_connections': 0,
+        'rate_limit': {},
+        'topics': None,
+    }]
+
+
+def test_single_listener_from_top_level(tmp_path):
+    config = load(tmp_path, {'host': '0.0.0.0', 'port': 9000, 'secretkey': 'k'})
+    listener, = config.listeners
+    assert listener['host'] == '0.0.0.0'
+    assert listener['port'] == 9000
+    assert listener['secretkey'] == 'k'
+
+
+def test_listeners_inherit_top_level(tmp_path):
+    ssl = {'cert_path': 'cert.pem', 'key_path': 'key.pem'}
+    config = load(tmp_path, {
+        'secretkey': 'k',
+        'rate_limit': {'secret': {'rate': 5}},
+        'listeners': [
+            {},
+            {'host': '0.0.0.0', 'port': 8443, 'secretkey': 'lan', 'ssl': ssl, 'topics': ['stroked']},
+        ],
+    })
+
+    local, lan = config.listeners
+    assert local['host'] == DEFAULT_HOST
+    assert local['port'] == DEFAULT_PORT
+    assert local['secretkey'] == 'k'
+    assert local['topics'] is None
+    assert lan['secretkey'] == 'lan'
+    assert lan['ssl'] == ssl
+    assert lan['topics'] == ['stroked']
+    assert lan['rate_limit'] == {'secret': {'rate': 5}}
+
+
+def test_empty_listeners(tmp_path):
+    config = load(tmp_path, {'port': 9000, 'listeners': []})
+    listener, = config.listeners
+    assert listener['port'] == 9000
+
+
+def test_null_analytics(tmp_path):
+    assert load(tmp_path, {'analytics': None}).analytics == {}
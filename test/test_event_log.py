@@ -0,0 +1,75 @@
+"""Tests for the long-poll event log."""
+
+import asyncio
+
+from plover_engine_server.websocket.peer import EventLog
+
+
+def test_empty_log():
+    event_log = EventLog()
+    assert event_log.next == 0
+    assert event_log.read(0) == ([], 0)
+
+
+def test_cursor():
+    event_log = EventLog()
+    for i in range(3):
+        event_log.append('stroked', f'frame{i}')
+
+    assert event_log.next == 3
+    assert event_log.read(0) == (['frame0', 'frame1', 'frame2'], 0)
+    assert event_log.read(2) == (['frame2'], 0)
+    assert event_log.read(3) == ([], 0)
+
+
+def test_topics():
+    event_log = EventLog()
+    event_log.append('stroked', 'a')
+    event_log.append('translated', 'b')
+    event_log.append('stroked', 'c')
+
+    assert event_log.read(0, frozenset({'stroked'})) == (['a', 'c'], 0)
+    assert event_log.read(0, frozenset()) == ([], 0)
+
+
+def test_missed():
+    event_log = EventLog(size=3)
+    for i in range(5):
+        event_log.append('stroked', f'frame{i}')
+
+    assert event_log.next == 5
+    assert event_log.read(0) == (['frame2', 'frame3', 'frame4'], 2)
+    assert event_log.read(1) == (['frame2', 'frame3', 'frame4'], 1)
+    assert event_log.read(2) == (['frame2', 'frame3', 'frame4'], 0)
+    assert event_log.read(4) == (['frame4'], 0)
+
+
+def test_wait_returns_when_frames_are_available():
+    async def run():
+        event_log = EventLog()
+        event_log.append('stroked', 'a')
+        await asyncio.wait_for(event_log.wait(0, 10), 1)
+
+    asyncio.run(run())
+
+
+def test_wait_wakes_up_on_append():
+    async def run():
+        event_log = EventLog()
+        waiter = asyncio.ensure_future(event_log.wait(0, 10))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        event_log.append('stroked', 'a')
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+
+
+def test_wait_times_out():
+    async def run():
+        event_log = EventLog()
+        await event_log.wait(0, 0.01)
+        return event_log.read(0)
+
+    assert asyncio.run(run()) == ([], 0)
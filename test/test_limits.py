@@ -0,0 +1,64 @@
+"""Tests for the rate limiters."""
+
+import pytest
+
+from plover_engine_server import limits
+from plover_engine_server.limits import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(limits, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_unlimited_bucket(clock):
+    bucket = TokenBucket(0)
+    assert all(bucket.consume() for _ in range(10000))
+
+
+def test_burst_then_limited(clock):
+    bucket = TokenBucket(rate=2, burst=5)
+    assert [bucket.consume() for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_burst_defaults_to_rate(clock):
+    bucket = TokenBucket(rate=3)
+    assert [bucket.consume() for _ in range(4)] == [True] * 3 + [False]
+
+
+def test_refill(clock):
+    bucket = TokenBucket(rate=2, burst=5)
+    for _ in range(5):
+        bucket.consume()
+    assert not bucket.consume()
+
+    clock[0] += 0.5
+    assert bucket.consume()
+    assert not bucket.consume()
+
+    clock[0] += 1
+    assert bucket.consume()
+    assert bucket.consume()
+    assert not bucket.consume()
+
+
+def test_refill_is_capped_by_burst(clock):
+    bucket = TokenBucket(rate=2, burst=5)
+    bucket.consume()
+
+    clock[0] += 3600
+    assert [bucket.consume() for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_rejected_consume_takes_no_tokens(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    assert not bucket.consume(3)
+    assert bucket.consume(2)
+
+
+def test_from_config(clock):
+    assert TokenBucket.from_config(None).consume(10 ** 9)
+    bucket = TokenBucket.from_config({'rate': 1, 'burst': 2})
+    assert [bucket.consume() for _ in range(3)] == [True, True, False]
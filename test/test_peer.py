@@ -0,0 +1,201 @@
+"""Tests for the outbound lanes of connected clients."""
+
+import asyncio
+import json
+import socket
+
+import pytest
+
+from plover_engine_server.server import MessagePriority
+from plover_engine_server.stats import ServerStats
+from plover_engine_server.websocket.peer import (
+    Peer,
+    encode_frames,
+    set_dead_peer_timeout,
+    websocket_response
+)
+
+
+class FakeRequest:
+    transport = None
+
+
+class RecordingPeer(Peer):
+    """A peer which records the frames it sends."""
+
+    def __init__(self, keepalive=None):
+        super().__init__(FakeRequest(), None, ServerStats(), keepalive=keepalive)
+        self.sent = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def _send(self, frame: str):
+        self.sent.append(frame)
+        await self.release.wait()
+
+    async def _flush(self):
+        pass
+
+
+async def settle():
+    # sends run in tasks created by wait_for, so give them a few iterations
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+def test_encode_frames_realtime_is_single_frame():
+    data = {'config_changed': {str(i): 'x' * 100 for i in range(100)}}
+    assert encode_frames(data, MessagePriority.Realtime, 100) == [json.dumps(data)]
+
+
+def test_encode_frames_small_bulk_is_single_frame():
+    data = {'config_changed': {'a': 1, 'b': [2, 3]}}
+    assert encode_frames(data, MessagePriority.Bulk, 16384) == [json.dumps(data)]
+
+
+def test_encode_frames_non_object_bulk_is_single_frame():
+    data = {'config_changed': ['x' * 100] * 10}
+    assert encode_frames(data, MessagePriority.Bulk, 10) == [json.dumps(data)]
+
+
+def test_encode_frames_empty_object():
+    data = {'config_changed': {}}
+    assert encode_frames(data, MessagePriority.Bulk, 10) == [json.dumps(data)]
+
+
+def test_encode_frames_chunks_remerge():
+    value = {f'key{i}': 'x' * i for i in range(50)}
+    frames = encode_frames({'config_changed': value}, MessagePriority.Bulk, 200)
+
+    assert len(frames) > 1
+    merged = {}
+    for frame in frames:
+        (event, part), = json.loads(frame).items()
+        assert event == 'config_changed'
+        assert part
+        assert not merged.keys() & part.keys()
+        merged.update(part)
+    assert merged == value
+    assert list(merged) == list(value)
+
+
+def test_encode_frames_chunk_boundaries():
+    # each entry is '"k0": "xxxxxxxx"', 16 characters, plus 2 for the separator
+    value = {f'k{i}': 'x' * 8 for i in range(6)}
+    frames = encode_frames({'e': value}, MessagePriority.Bulk, 36)
+
+    assert [len(json.loads(frame)['e']) for frame in frames] == [2, 2, 2]
+
+
+def test_encode_frames_oversized_entry_gets_own_frame():
+    value = {'small': 1, 'big': 'x' * 1000, 'other': 2}
+    frames = encode_frames({'e': value}, MessagePriority.Bulk, 100)
+
+    assert [list(json.loads(frame)['e']) for frame in frames] == [['small'], ['big'], ['other']]
+
+
+def test_realtime_overtakes_queued_bulk():
+    async def run():
+        peer = RecordingPeer()
+        for i in range(3):
+            peer.enqueue(f'bulk{i}', MessagePriority.Bulk, 0)
+        peer.enqueue('realtime', MessagePriority.Realtime, 0)
+
+        peer.start()
+        await settle()
+        await peer.stop()
+        return peer.sent
+
+    assert asyncio.run(run()) == ['realtime', 'bulk0', 'bulk1', 'bulk2']
+
+
+def test_realtime_waits_only_for_bulk_in_flight():
+    async def run():
+        peer = RecordingPeer()
+        peer.release.clear()
+        peer.start()
+
+        peer.enqueue('bulk0', MessagePriority.Bulk, 0)
+        peer.enqueue('bulk1', MessagePriority.Bulk, 0)
+        await settle()
+        # bulk0 is now being sent
+        peer.enqueue('realtime', MessagePriority.Realtime, 0)
+        peer.release.set()
+        await settle()
+        await peer.stop()
+        return peer
+
+    peer = asyncio.run(run())
+    assert peer.sent == ['bulk0', 'realtime', 'bulk1']
+    latencies = peer._stats.as_dict()['latencies']
+    assert latencies['realtime']['count'] == 1
+    assert latencies['realtime_during_bulk']['count'] == 1
+    assert latencies['bulk']['count'] == 2
+
+
+def test_realtime_without_bulk_is_not_counted_as_during_bulk():
+    async def run():
+        peer = RecordingPeer()
+        peer.start()
+        peer.enqueue('realtime', MessagePriority.Realtime, 0)
+        await settle()
+        await peer.stop()
+        return peer
+
+    latencies = asyncio.run(run())._stats.as_dict()['latencies']
+    assert latencies['realtime']['count'] == 1
+    assert 'realtime_during_bulk' not in latencies
+
+
+def test_overflowing_peer_is_aborted():
+    async def run():
+        peer = RecordingPeer()
+        peer._max_queued = 2
+        for i in range(3):
+            peer.enqueue(f'bulk{i}', MessagePriority.Bulk, 0)
+        return peer
+
+    peer = asyncio.run(run())
+    assert peer._closed
+    assert peer._stats.counters['queue_overflows'] == 1
+
+
+def test_write_timeout_aborts_peer():
+    async def run():
+        peer = RecordingPeer({'write_timeout': 0.01})
+        peer.release.clear()
+        peer.start()
+        peer.enqueue('realtime', MessagePriority.Realtime, 0)
+        await asyncio.wait_for(peer.join(), 1)
+        return peer
+
+    peer = asyncio.run(run())
+    assert peer._closed
+    assert peer._stats.counters['write_timeouts'] == 1
+
+
+def test_websocket_response_keepalive():
+    response = websocket_response({'heartbeat': 3, 'idle_timeout': 7})
+    assert response._heartbeat == 3
+    assert response._receive_timeout == 7
+
+
+def test_websocket_response_keepalive_disabled():
+    response = websocket_response({'heartbeat': 0, 'idle_timeout': 0})
+    assert response._heartbeat is None
+    assert response._receive_timeout is None
+
+
+@pytest.mark.skipif(not hasattr(socket, 'TCP_USER_TIMEOUT'), reason='Linux only')
+def test_set_dead_peer_timeout():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        set_dead_peer_timeout(sock, 7, 3)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT) == 7000
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 3
+
+
+def test_set_dead_peer_timeout_ignores_other_sockets():
+    set_dead_peer_timeout(None, 7)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        set_dead_peer_timeout(sock, 7)
@@ -0,0 +1,78 @@
+"""Tests for the event loop selection."""
+
+import asyncio
+import sys
+import types
+
+import pytest
+
+from plover_engine_server.server import ServerStatus, new_event_loop
+from plover_engine_server.websocket.server import WebSocketServer
+
+
+class FakeLoop(asyncio.SelectorEventLoop):
+    """An alternative event loop implementation."""
+
+
+@pytest.fixture
+def fake_uvloop(monkeypatch):
+    module = types.ModuleType('uvloop')
+    module.new_event_loop = FakeLoop
+    monkeypatch.setitem(sys.modules, 'uvloop', module)
+
+
+def test_default_loop():
+    loop = new_event_loop()
+    loop.close()
+    assert type(loop) is type(asyncio.new_event_loop())
+
+
+def test_alternative_loop(fake_uvloop):
+    loop = new_event_loop('uvloop')
+    loop.close()
+    assert type(loop) is FakeLoop
+
+
+@pytest.mark.parametrize('name', ['uvloop', 'winloop'])
+def test_missing_loop_falls_back_to_asyncio(monkeypatch, name):
+    # a None entry makes the import fail as if the module was not installed
+    monkeypatch.setitem(sys.modules, name, None)
+    loop = new_event_loop(name)
+    loop.close()
+    assert type(loop) is type(asyncio.new_event_loop())
+
+
+def test_unknown_loop_falls_back_to_asyncio():
+    loop = new_event_loop('tokio')
+    loop.close()
+    assert type(loop) is type(asyncio.new_event_loop())
+
+
+def run_server(event_loop: str):
+    """Starts and stops a server.
+
+    Returns:
+        The stopped server, and the type of the event loop it ran on.
+    """
+
+    server = WebSocketServer([{'host': 'localhost', 'port': 0, 'secretkey': 'k'}],
+                             event_loop=event_loop, loop_lag_interval=0)
+    server.start()
+    try:
+        for _ in range(500):
+            if server.status == ServerStatus.Running:
+                break
+            server._thread.join(0.01)
+        assert server.status == ServerStatus.Running
+        loop_type = type(server._loop)
+    finally:
+        server.queue_stop()
+        server.join()
+    return server, loop_type
+
+
+@pytest.mark.parametrize('event_loop', ['asyncio', 'uvloop', 'tokio'])
+def test_stats_report_the_loop_in_use(fake_uvloop, event_loop):
+    server, loop_type = run_server(event_loop)
+    assert server.stats.info['event_loop'] == f'{loop_type.__module__}.{loop_type.__qualname__}'
+    assert (loop_type is FakeLoop) == (event_loop == 'uvloop')
@@ -0,0 +1,22 @@
+"""Tests for the server statistics."""
+
+import asyncio
+import time
+
+from plover_engine_server.stats import ServerStats, sample_loop_lag
+
+
+def test_sample_loop_lag_records_blocked_loop():
+    async def run():
+        stats = ServerStats()
+        sampler = asyncio.ensure_future(sample_loop_lag(stats, 0.01))
+        await asyncio.sleep(0.02)
+        # blocks the loop while the sampler sleeps
+        asyncio.get_running_loop().call_soon(time.sleep, 0.1)
+        await asyncio.sleep(0.05)
+        sampler.cancel()
+        return stats
+
+    latencies = asyncio.run(run()).as_dict()['latencies']
+    assert latencies['loop_lag']['count'] >= 2
+    assert latencies['loop_lag']['max_ms'] >= 50
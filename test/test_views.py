@@ -0,0 +1,239 @@
+"""Tests for the HTTP routes of the server."""
+
+import asyncio
+import json
+
+from aiohttp import WSMsgType, WSServerHandshakeError
+from aiohttp.test_utils import TestClient, TestServer
+
+from plover_engine_server.analytics import StrokeAnalytics
+from plover_engine_server.server import MessagePriority
+from plover_engine_server.websocket.peer import EventLog
+from plover_engine_server.websocket.server import WebSocketServer
+
+
+HEADERS = {'X-Secret-Token': 'k'}
+
+
+def run_with_client(test, server_options=None, **listener):
+    """Runs a test against the application serving a single listener.
+
+    Args:
+        test: A coroutine function taking the test client.
+        server_options: Keyword arguments of the server, other than its listeners.
+        listener: Overrides of the listener configuration.
+    """
+
+    async def run():
+        server = WebSocketServer([{'host': 'localhost', 'port': 0, 'secretkey': 'k', **listener}],
+                                 **(server_options or {}))
+        app = server._create_app(server._listeners[0], EventLog())
+        app['server'] = server
+        async with TestClient(TestServer(app)) as client:
+            await test(client)
+
+    asyncio.run(run())
+
+
+async def send_messages(client, *messages, headers=HEADERS):
+    """Sends messages on a new WebSocket, then waits until the server handled them."""
+
+    socket = await client.ws_connect('/websocket', headers=headers)
+    for message in messages:
+        await socket.send_str(message)
+    # handled in order, so once the socket is closed every message was handled
+    await socket.send_str('close')
+    await socket.receive()
+    await socket.close()
+
+
+def test_wrong_secret_is_forbidden():
+    async def test(client):
+        for headers in ({}, {'X-Secret-Token': 'wrong'}):
+            assert (await client.get('/stats', headers=headers)).status == 403
+        assert client.server.app['stats'].counters['auth_failures'] == 2
+
+    run_with_client(test)
+
+
+def test_secret_which_is_not_utf8_is_forbidden():
+    async def test(client):
+        reader, writer = await asyncio.open_connection(client.host, client.port)
+        writer.write(b'GET /stats HTTP/1.1\r\nHost: localhost\r\n'
+                     b'X-Secret-Token: \xff\xfe\r\nConnection: close\r\n\r\n')
+        status_line = await reader.readline()
+        writer.close()
+
+        assert status_line.split()[1] == b'403'
+        assert client.server.app['stats'].counters['auth_failures'] == 1
+
+    run_with_client(test)
+
+
+def test_connections_over_the_limit_are_rejected():
+    async def test(client):
+        socket = await client.ws_connect('/websocket', headers=HEADERS)
+        try:
+            await client.ws_connect('/websocket', headers=HEADERS)
+        except WSServerHandshakeError as e:
+            assert e.status == 503
+        else:
+            raise AssertionError('the second connection was accepted')
+        await socket.close()
+
+        assert client.server.app['stats'].counters['connections_rejected'] == 1
+
+    run_with_client(test, max_connections=1)
+
+
+def test_messages_over_the_rate_limit_are_dropped():
+    async def test(client):
+        received = []
+        client.server.app['server'].register_message_callback(received.append)
+
+        # the dropped messages are not even parsed
+        await send_messages(client, '{"a": 1}', '{"a": 2}', '{"a": 3}', 'not json')
+
+        assert received == [{'a': 1}, {'a': 2}]
+        assert client.server.app['stats'].counters['messages_rate_limited'] == 2
+
+    run_with_client(test, rate_limit={'connection': {'rate': 0.01, 'burst': 2}})
+
+
+def test_secret_rate_limit_is_shared_across_connections():
+    async def test(client):
+        received = []
+        client.server.app['server'].register_message_callback(received.append)
+
+        await send_messages(client, '{"a": 1}', '{"a": 2}')
+        await send_messages(client, '{"a": 3}', '{"a": 4}')
+
+        assert received == [{'a': 1}, {'a': 2}, {'a': 3}]
+        assert client.server.app['stats'].counters['messages_rate_limited'] == 1
+
+    run_with_client(test, rate_limit={'secret': {'rate': 0.01, 'burst': 3}})
+
+
+def test_idle_client_is_disconnected():
+    async def test(client):
+        socket = await client.ws_connect('/websocket', headers=HEADERS)
+        message = await asyncio.wait_for(socket.receive(), 1)
+        await socket.close()
+
+        app = client.server.app
+        assert message.type == WSMsgType.CLOSE
+        assert not app['peers']
+        assert app['stats'].counters['idle_timeouts'] == 1
+
+    run_with_client(test, {'keepalive': {'heartbeat': 0, 'idle_timeout': 0.1}})
+
+
+def test_client_answering_pings_stays_connected():
+    async def test(client):
+        socket = await client.ws_connect('/websocket', headers=HEADERS)
+        # the client answers the pings while waiting for a message
+        receiving = asyncio.ensure_future(socket.receive())
+        await asyncio.sleep(0.5)
+        assert not receiving.done()
+        receiving.cancel()
+
+        app = client.server.app
+        assert len(app['peers']) == 1
+        assert app['stats'].counters['idle_timeouts'] == 0
+        await socket.close()
+
+    run_with_client(test, {'keepalive': {'heartbeat': 0.05, 'idle_timeout': 0.15}})
+
+
+def test_analytics_summary_is_published_whole():
+    class Subscriber:
+        def __init__(self):
+            self.frames = []
+
+        def wants(self, topic):
+            return True
+
+        def enqueue(self, frame, priority, queued_at):
+            self.frames.append((frame, priority))
+
+    async def test(client):
+        app = client.server.app
+        analytics = app['analytics']
+        for i in range(20):
+            analytics.record_stroke(f'S{i}')
+        subscriber = Subscriber()
+        app['peers'].add(subscriber)
+        server = app['server']
+        server._apps = [app]
+
+        publisher = asyncio.ensure_future(server._publish_analytics())
+        await asyncio.sleep(0.05)
+        publisher.cancel()
+        app['peers'].discard(subscriber)
+
+        frame, priority = subscriber.frames[0]
+        assert priority == MessagePriority.Realtime
+        assert len(json.loads(frame)['analytics']['top_outlines']) == 20
+
+    analytics = StrokeAnalytics(top_outlines=20, interval=0.01)
+    run_with_client(test, {'analytics': analytics, 'bulk_chunk_size': 10})
+
+
+def test_poll_rejects_negative_cursor():
+    async def test(client):
+        response = await client.get('/poll?since=-5000&timeout=0', headers=HEADERS)
+        assert response.status == 400
+
+    run_with_client(test)
+
+
+def test_poll_returns_cursor():
+    async def test(client):
+        response = await client.get('/poll?timeout=0', headers=HEADERS)
+        assert response.status == 200
+        assert await response.json() == {'next': 0, 'missed': 0, 'events': []}
+
+    run_with_client(test)
+
+
+def test_poll_has_its_own_bucket():
+    async def test(client):
+        statuses = [(await client.get('/poll?timeout=0', headers=HEADERS)).status
+                    for _ in range(3)]
+        assert statuses == [200, 200, 429]
+
+        app = client.server.app
+        assert app['secret_bucket'].consume()
+        assert app['stats'].counters['polls_rate_limited'] == 1
+
+    run_with_client(test, rate_limit={'secret': {'rate': 1}, 'poll': {'rate': 0.01, 'burst': 2}})
+
+
+def test_listeners_sharing_a_secret_share_its_buckets():
+    server = WebSocketServer([
+        {'host': 'localhost', 'port': 0, 'secretkey': 'k', 'rate_limit': {'secret': {'rate': 1}}},
+        {'host': 'localhost', 'port': 1, 'secretkey': 'k', 'rate_limit': {'secret': {'rate': 1}}},
+        {'host': 'localhost', 'port': 2, 'secretkey': 'other', 'rate_limit': {'secret': {'rate': 1}}},
+    ])
+    event_log = EventLog()
+    first, second, other = (server._create_app(listener, event_log) for listener in server._listeners)
+
+    assert first['secret_bucket'] is second['secret_bucket']
+    assert first['poll_bucket'] is second['poll_bucket']
+    assert first['secret_bucket'] is not first['poll_bucket']
+    assert first['secret_bucket'] is not other['secret_bucket']
+
+
+def test_restricted_listener_hides_analytics_and_stats():
+    async def test(client):
+        assert (await client.get('/analytics', headers=HEADERS)).status == 404
+        assert (await client.get('/stats', headers=HEADERS)).status == 404
+
+    run_with_client(test, topics=['stroked'])
+
+
+def test_unrestricted_listener_serves_stats():
+    async def test(client):
+        assert (await client.get('/stats', headers=HEADERS)).status == 200
+
+    run_with_client(test)